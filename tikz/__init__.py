@@ -13,19 +13,24 @@ notebook seamless.
 
 import atexit
 import base64
+import functools
 import hashlib
 import html
 import numbers
 import os
 import os.path
+import re
 import shutil
 import subprocess
+import sys
 import tempfile
+import threading
 
-import fitz
-import IPython.display
 import numpy as np
 
+# PyMuPDF (`fitz`) and IPython are imported where they are used, because they
+# are slow to import and not needed for creating TikZ code.
+
 
 class cfg:
     "tikz configuration variables"
@@ -49,6 +54,33 @@ class cfg:
     name of the executable used to compile the LaTeX document
     """
 
+    cache_dir = os.path.abspath(os.path.expanduser(
+        os.environ.get('PYTIKZ_CACHE')
+        or os.path.join('~', '.cache', 'pytikz')))
+    """
+    directory in which compiled PDF files are cached
+
+    Files are named by a BLAKE2 digest of the LaTeX code and persist across
+    sessions, so that unchanged pictures do not have to be compiled again.
+    PNG and SVG data converted from them for display are cached alongside.
+    The default is the value of the environment variable `PYTIKZ_CACHE`, or
+    `~/.cache/pytikz` if it is not set or empty, made into an absolute path.
+    """
+
+    preload = False
+    """
+    whether to preload the standard preamble from a precompiled format
+
+    If `True`, a LaTeX format file containing the document class and TikZ is
+    created once in `cfg.cache_dir` using the LaTeX package
+    [mylatexformat](https://ctan.org/pkg/mylatexformat), and used for all
+    subsequent compilations. This saves the time to load TikZ every time a
+    picture is compiled. The format file has to be deleted when the LaTeX
+    installation is updated.
+
+    The default is `False`.
+    """
+
     demo_template = '\n'.join([
         '<div style="background-color:#e0e0e0;margin:0">',
         '  <div>',
@@ -74,6 +106,19 @@ class cfg:
 # helper functions and helper-helper functions
 
 
+@functools.lru_cache(maxsize=None)
+def _option_key(key):
+    """
+    returns TikZ option name for keyword argument name
+
+    Underscores are replaced by spaces. Since the same few option names are
+    used over and over again, results are cached.
+
+    helper function for `_option_code`
+    """
+    return str(key).replace('_', ' ')
+
+
 def _option_code(key, val):
     """
     returns TikZ code for single option
@@ -81,7 +126,7 @@ def _option_code(key, val):
     helper function for `_options`
     """
     # replace underscores by spaces
-    key = str(key).replace('_', ' ')
+    key = _option_key(key)
     if val is True:
         # omit `=True`
         return key
@@ -95,6 +140,9 @@ def _options_code(opt=None, **kwoptions):
 
     helper function to format `opt=None, **kwoptions` in various functions
     """
+    # most calls have no options at all
+    if opt is None and not kwoptions:
+        return ''
     # use `_option_code` to transform individual options
     o = [_option_code(key, val) for key, val in kwoptions.items()
          if val is not None]
@@ -106,18 +154,47 @@ def _options_code(opt=None, **kwoptions):
     # suppress empty options
     if code == '[]':
         code = ''
+    # Options code is stored by many objects and often identical, so short
+    # strings are interned to be stored only once.
+    if len(code) < 64:
+        code = sys.intern(code)
     return code
 
 
 # check types
 def _str(obj): return isinstance(obj, str)
 def _tuple(obj): return isinstance(obj, tuple)
-def _numeric(obj): return isinstance(obj, numbers.Real)
-def _str_or_numeric(obj): return _str(obj) or _numeric(obj)
 def _ndarray(obj): return isinstance(obj, np.ndarray)
 def _list(obj): return isinstance(obj, list)                                        # noqa E302
 
 
+# `isinstance` with an abstract base class like `numbers.Real` is slow, so
+# common concrete types are checked first.
+_numeric_types = (int, float, np.integer, np.floating)
+_str_or_numeric_types = (str,) + _numeric_types
+
+
+def _numeric(obj):
+    return isinstance(obj, _numeric_types) or isinstance(obj, numbers.Real)
+
+
+def _str_or_numeric(obj):
+    return isinstance(obj, _str_or_numeric_types) or _numeric(obj)
+
+
+def _numeric_ndarray(arr):
+    """
+    check whether all elements of ndarray are numeric
+
+    Decided by the dtype, without iterating over the elements, except for
+    object arrays.
+    """
+    if arr.dtype == object:
+        return all(_numeric(x) for x in arr.flat)
+    return (np.issubdtype(arr.dtype, np.integer)
+            or np.issubdtype(arr.dtype, np.floating))
+
+
 def _coordinate(coord):
     """
     check and normalize coordinate
@@ -128,6 +205,10 @@ def _coordinate(coord):
             (coord.startswith(('(', '+(', '++(')) and coord.endswith(')'))
             or coord == 'cycle'):
         return coord
+    # A coordinate can be a 2/3-element 1d-ndarray.
+    if (_ndarray(coord) and coord.ndim == 1 and coord.size in [2, 3]
+            and _numeric_ndarray(coord)):
+        return coord
     # A coordinate can be a 2/3-element tuple containing strings or numbers:
     if (_tuple(coord) and len(coord) in [2, 3]
             and all(_str_or_numeric(x) for x in coord)):
@@ -139,10 +220,6 @@ def _coordinate(coord):
             return np.array(coord)
         # If mixed, keep.
         return coord
-    # A coordinate can be a 2/3-element 1d-ndarray.
-    if (_ndarray(coord) and coord.ndim == 1 and coord.size in [2, 3]
-            and all(_numeric(x) for x in coord)):
-        return coord
     # Otherwise, report error.
     raise TypeError(f'{coord} is not a coordinate')
 
@@ -155,6 +232,20 @@ def _sequence(seq, accept_coordinate=True):
     """
     # A sequence can be a list.
     if _list(seq):
+        # Fast path for a list of numeric tuples: convert to 2d-ndarray at
+        # once instead of normalizing each coordinate. Tuples of different
+        # lengths are excluded beforehand, because depending on the NumPy
+        # version they would give an error or a warning and an object array.
+        if (seq and all(_tuple(coord) for coord in seq)
+                and all(len(coord) == len(seq[0]) for coord in seq)):
+            try:
+                arr = np.array(seq)
+            except ValueError:
+                # invalid nested elements, reported below
+                arr = None
+            if (arr is not None and arr.ndim == 2 and arr.shape[1] in [2, 3]
+                    and _numeric_ndarray(arr)):
+                return arr
         # Normalize contained coordinates.
         seq = [_coordinate(coord) for coord in seq]
         # If all coordinates are 1d-ndarrays, make the sequence a 2d-ndarray.
@@ -164,7 +255,7 @@ def _sequence(seq, accept_coordinate=True):
         return seq
     # A sequence can be a numeric 2d-ndarray with 2 or 3 columns.
     if (_ndarray(seq) and seq.ndim == 2 and seq.shape[1] in [2, 3]
-            and all(_numeric(x) for x in seq.flat)):
+            and _numeric_ndarray(seq)):
         return seq
     # Optionally accept a coordinate and turn it into a 1-element sequence.
     if accept_coordinate:
@@ -187,7 +278,7 @@ def _str_or_numeric_code(x):
     else:
         # convert numeric elements to a fixed-point representation with 5
         # decimals precision (TikZ: ±16383.99999) without trailing '0's or '.'
-        return '{:.5f}'.format(x).rstrip('0').rstrip('.')
+        return f'{x:.5f}'.rstrip('0').rstrip('.')
 
 
 def _coordinate_code(coord, trans=None):
@@ -202,6 +293,29 @@ def _coordinate_code(coord, trans=None):
         return '(' + ','.join(map(_str_or_numeric_code, coord)) + ')'
 
 
+_trailing_zeros = re.compile(r'\.?0+(?=[,)])')
+"matches trailing '0's and '.' of numbers formatted by `_sequence_code`"
+
+
+def _sequence_code(seq, trans=None):
+    "returns list of TikZ code for sequence of coordinates"
+    # assumes the argument has already been normalized
+    if _ndarray(seq) and trans is None and len(seq) > 0:
+        # Format all coordinates of a 2d-ndarray in one go and strip trailing
+        # '0's and '.' with a single regular expression, which gives the same
+        # result as `_str_or_numeric_code` at about twice the speed.
+        n, m = seq.shape
+        fmt = '(' + ','.join(['{:.5f}'] * m) + ')'
+        code = '\n'.join([fmt] * n).format(*seq.ravel().tolist())
+        return _trailing_zeros.sub('', code).split('\n')
+    if _ndarray(seq):
+        # Converting a 2d-ndarray to nested lists at once is much faster than
+        # iterating over its rows, and the resulting Python numbers are
+        # formatted faster than NumPy scalars.
+        seq = seq.tolist()
+    return [_coordinate_code(coord, trans) for coord in seq]
+
+
 # coordinates
 
 
@@ -223,6 +337,8 @@ class Raw:
     because the respective methods accept strings and convert them into `Raw`
     objects internally.
     """
+    __slots__ = ('string',)
+
     def __init__(self, string):
         self.string = string
 
@@ -250,6 +366,8 @@ class Operation:
 
     This is an abstract superclass that is not to be instantiated.
     """
+    __slots__ = ()
+
     def _code(self):
         "returns TikZ code"
         pass
@@ -263,6 +381,8 @@ class moveto(Operation):
 
     See [§14.1](https://pgf-tikz.github.io/pgf/pgfmanual.pdf#subsection.14.1)
     """
+    __slots__ = ('coords',)
+
     def __init__(self, coords):
         # normalize coordinates
         self.coords = _sequence(coords, accept_coordinate=True)
@@ -270,8 +390,7 @@ class moveto(Operation):
     def _code(self, trans=None):
         # put move-to operation before each coordinate,
         # for the first one implicitly
-        return ' '.join(_coordinate_code(coord, trans)
-                        for coord in self.coords)
+        return ' '.join(_sequence_code(self.coords, trans))
 
 
 class lineto(Operation):
@@ -285,6 +404,8 @@ class lineto(Operation):
 
     see [§14.2](https://pgf-tikz.github.io/pgf/pgfmanual.pdf#subsection.14.2)
     """
+    __slots__ = ('coords', 'op')
+
     def __init__(self, coords, op='--'):
         # normalize coordinates
         self.coords = _sequence(coords, accept_coordinate=True)
@@ -293,7 +414,7 @@ class lineto(Operation):
     def _code(self, trans=None):
         # put line-to operation before each coordinate
         return f'{self.op} ' + f' {self.op} '.join(
-            _coordinate_code(coord, trans) for coord in self.coords)
+            _sequence_code(self.coords, trans))
 
 
 class line(Operation):
@@ -302,6 +423,8 @@ class line(Operation):
 
     Starts with move-to instead of line-to operation.
     """
+    __slots__ = ('coords', 'op')
+
     def __init__(self, coords, op='--'):
         # normalize coordinates
         self.coords = _sequence(coords)
@@ -310,8 +433,7 @@ class line(Operation):
     def _code(self, trans=None):
         # put line-to operation between coordinates
         # (implicit move-to before first)
-        return f' {self.op} '.join(
-            _coordinate_code(coord, trans) for coord in self.coords)
+        return f' {self.op} '.join(_sequence_code(self.coords, trans))
 
 
 class curveto(Operation):
@@ -322,6 +444,8 @@ class curveto(Operation):
 
     see [§14.3](https://pgf-tikz.github.io/pgf/pgfmanual.pdf#subsection.14.3)
     """
+    __slots__ = ('coord', 'control1', 'control2')
+
     def __init__(self, coord, control1, control2=None):
         # normalize coordinates
         self.coord = _coordinate(coord)
@@ -347,6 +471,8 @@ class rectangle(Operation):
 
     see [§14.4](https://pgf-tikz.github.io/pgf/pgfmanual.pdf#subsection.14.4)
     """
+    __slots__ = ('coord',)
+
     def __init__(self, coord):
         # normalize coordinate
         self.coord = _coordinate(coord)
@@ -368,6 +494,8 @@ class circle(Operation):
 
     see [§14.6](https://pgf-tikz.github.io/pgf/pgfmanual.pdf#subsection.14.6)
     """
+    __slots__ = ('x_radius', 'y_radius', 'at', 'opt', 'kwoptions')
+
     def __init__(self, radius=None, x_radius=None, y_radius=None, at=None,
                  opt=None, **kwoptions):
         # overriding logic
@@ -387,7 +515,8 @@ class circle(Operation):
         self.kwoptions = kwoptions
 
     def _code(self, trans=None):
-        kwoptions = self.kwoptions
+        # The options depend on `trans`, so they are added to a copy.
+        kwoptions = self.kwoptions.copy()
         x_radius, y_radius = self.x_radius, self.y_radius
         if trans is not None:
             x_radius, y_radius = trans(x_radius, y_radius)
@@ -398,7 +527,7 @@ class circle(Operation):
             kwoptions['y_radius'] = y_radius
         if self.at is not None:
             kwoptions['at'] = _coordinate_code(self.at, None)
-        return 'circle' + _options_code(opt=self.opt, **self.kwoptions)
+        return 'circle' + _options_code(opt=self.opt, **kwoptions)
 
 
 class arc(Operation):
@@ -411,6 +540,8 @@ class arc(Operation):
 
     see [§14.7](https://pgf-tikz.github.io/pgf/pgfmanual.pdf#subsection.14.7)
     """
+    __slots__ = ('x_radius', 'y_radius', 'opt', 'kwoptions')
+
     def __init__(self, radius=None, x_radius=None, y_radius=None,
                  opt=None, **kwoptions):
         # overriding logic
@@ -425,7 +556,8 @@ class arc(Operation):
         self.kwoptions = kwoptions
 
     def _code(self, trans=None):
-        kwoptions = self.kwoptions
+        # The options depend on `trans`, so they are added to a copy.
+        kwoptions = self.kwoptions.copy()
         x_radius, y_radius = self.x_radius, self.y_radius
         if trans is not None:
             x_radius, y_radius = trans(x_radius, y_radius)
@@ -448,6 +580,8 @@ class grid(Operation):
 
     see [§14.8](https://pgf-tikz.github.io/pgf/pgfmanual.pdf#subsection.14.8)
     """
+    __slots__ = ('coord', 'xstep', 'ystep', 'opt', 'kwoptions')
+
     def __init__(self, coord, step=None, xstep=None, ystep=None,
                  opt=None, **kwoptions):
         # normalize coordinate
@@ -464,7 +598,8 @@ class grid(Operation):
         self.kwoptions = kwoptions
 
     def _code(self, trans=None):
-        kwoptions = self.kwoptions
+        # The options depend on `trans`, so they are added to a copy.
+        kwoptions = self.kwoptions.copy()
         xstep, ystep = self.xstep, self.ystep
         if trans is not None:
             xstep, ystep = trans(xstep, ystep)
@@ -485,6 +620,8 @@ class parabola(Operation):
 
     see [§14.9](https://pgf-tikz.github.io/pgf/pgfmanual.pdf#subsection.14.9)
     """
+    __slots__ = ('coord', 'bend', 'opt')
+
     def __init__(self, coord, bend=None, opt=None, **kwoptions):
         # normalize coordinates
         self.coord = _coordinate(coord)
@@ -492,11 +629,10 @@ class parabola(Operation):
             self.bend = _coordinate(bend)
         else:
             self.bend = None
-        self.opt = opt
-        self.kwoptions = kwoptions
+        self.opt = _options_code(opt=opt, **kwoptions)
 
     def _code(self, trans=None):
-        code = 'parabola' + _options_code(opt=self.opt, **self.kwoptions)
+        code = 'parabola' + self.opt
         if self.bend is not None:
             code += ' bend ' + _coordinate_code(self.bend, trans)
         code += ' ' + _coordinate_code(self.coord, trans)
@@ -511,15 +647,15 @@ class sin(Operation):
 
     see [§14.10](https://pgf-tikz.github.io/pgf/pgfmanual.pdf#subsection.14.10)
     """
+    __slots__ = ('coord', 'opt')
+
     def __init__(self, coord, opt=None, **kwoptions):
         # normalize coordinate
         self.coord = _coordinate(coord)
-        self.opt = opt
-        self.kwoptions = kwoptions
+        self.opt = _options_code(opt=opt, **kwoptions)
 
     def _code(self, trans=None):
-        return ('sin' + _options_code(opt=self.opt, **self.kwoptions)
-                + ' ' + _coordinate_code(self.coord, trans))
+        return 'sin' + self.opt + ' ' + _coordinate_code(self.coord, trans)
 
 
 class cos(Operation):
@@ -530,15 +666,15 @@ class cos(Operation):
 
     see [§14.10](https://pgf-tikz.github.io/pgf/pgfmanual.pdf#subsection.14.10)
     """
+    __slots__ = ('coord', 'opt')
+
     def __init__(self, coord, opt=None, **kwoptions):
         # normalize coordinate
         self.coord = _coordinate(coord)
-        self.opt = opt
-        self.kwoptions = kwoptions
+        self.opt = _options_code(opt=opt, **kwoptions)
 
     def _code(self, trans=None):
-        return ('cos' + _options_code(opt=self.opt, **self.kwoptions)
-                + ' ' + _coordinate_code(self.coord, trans))
+        return 'cos' + self.opt + ' ' + _coordinate_code(self.coord, trans)
 
 
 class topath(Operation):
@@ -549,15 +685,15 @@ class topath(Operation):
 
     see [§14.13](https://pgf-tikz.github.io/pgf/pgfmanual.pdf#subsection.14.13)
     """
+    __slots__ = ('coord', 'opt')
+
     def __init__(self, coord, opt=None, **kwoptions):
         # normalize coordinate
         self.coord = _coordinate(coord)
-        self.opt = opt
-        self.kwoptions = kwoptions
+        self.opt = _options_code(opt=opt, **kwoptions)
 
     def _code(self, trans=None):
-        return ('to' + _options_code(opt=self.opt, **self.kwoptions)
-                + ' ' + _coordinate_code(self.coord, trans))
+        return 'to' + self.opt + ' ' + _coordinate_code(self.coord, trans)
 
 
 class node(Operation):
@@ -579,6 +715,8 @@ class node(Operation):
 
     see [§17](https://pgf-tikz.github.io/pgf/pgfmanual.pdf#section.17)
     """
+    __slots__ = ('name', 'contents', 'at', 'headless', 'opt')
+
     # Provides 'headless' mode for `Scope.node` and `Scope.coordinate`
     def __init__(self, contents, name=None, at=None, _headless=False,
                  opt=None, **kwoptions):
@@ -590,15 +728,14 @@ class node(Operation):
         else:
             self.at = None
         self.headless = _headless
-        self.opt = opt
-        self.kwoptions = kwoptions
+        self.opt = _options_code(opt=opt, **kwoptions)
 
     def _code(self, trans=None):
         if not self.headless:
             code = 'node'
         else:
             code = ''
-        code += _options_code(opt=self.opt, **self.kwoptions)
+        code += self.opt
         if self.name is not None:
             code += f' ({self.name})'
         if self.at is not None:
@@ -626,6 +763,8 @@ class coordinate(Operation):
     see
     [§17.2.1](https://pgf-tikz.github.io/pgf/pgfmanual.pdf#subsubsection.17.2.1)
     """
+    __slots__ = ('name', 'at', 'headless', 'opt')
+
     def __init__(self, name, at=None, _headless=False, opt=None, **kwoptions):
         self.name = name
         # normalize coordinate
@@ -634,15 +773,14 @@ class coordinate(Operation):
         else:
             self.at = None
         self.headless = _headless
-        self.opt = opt
-        self.kwoptions = kwoptions
+        self.opt = _options_code(opt=opt, **kwoptions)
 
     def _code(self, trans=None):
         if not self.headless:
             code = 'coordinate'
         else:
             code = ''
-        code += _options_code(opt=self.opt, **self.kwoptions)
+        code += self.opt
         code += f' ({self.name})'
         if self.at is not None:
             code += ' at ' + _coordinate_code(self.at, trans)
@@ -667,12 +805,13 @@ class plot(Operation):
 
     see [§22](https://pgf-tikz.github.io/pgf/pgfmanual.pdf#section.22)
     """
+    __slots__ = ('coords', 'to', 'opt')
+
     def __init__(self, coords, to=False, opt=None, **kwoptions):
         # normalize coordinates
         self.coords = _sequence(coords, accept_coordinate=True)
         self.to = to
-        self.opt = opt
-        self.kwoptions = kwoptions
+        self.opt = _options_code(opt=opt, **kwoptions)
 
     def _code(self, trans=None):
         # TODO: Use the 'file' variant as an alternative to 'coordinates' when
@@ -681,9 +820,9 @@ class plot(Operation):
             code = '--plot'
         else:
             code = 'plot'
-        code += _options_code(opt=self.opt, **self.kwoptions)
-        code += ' coordinates {' + ' '.join(
-            _coordinate_code(coord, trans) for coord in self.coords) + '}'
+        code += self.opt
+        code += (' coordinates {'
+                 + ' '.join(_sequence_code(self.coords, trans)) + '}')
         return code
 
 
@@ -741,20 +880,30 @@ class Action:
     created and added implicitly by environment methods like
     [<code>Picture.path()</code>](#tikz.Scope.path).
 
+    The TikZ code of an action is created when it is first needed and then
+    reused, so the path specification (e.g. an array of coordinates) should
+    not be modified afterwards.
+
     see [§15](https://pgf-tikz.github.io/pgf/pgfmanual.pdf#section.15)
     """
+    __slots__ = ('action_name', 'spec', 'opt', '_codes')
+
     def __init__(self, action_name, *spec, opt=None, **kwoptions):
         self.action_name = action_name
         # normalize path specification
         self.spec = [_operation(op) for op in spec]
-        self.opt = opt
-        self.kwoptions = kwoptions
+        self.opt = _options_code(opt=opt, **kwoptions)
+        # created code, by coordinate transformation
+        self._codes = {}
 
     def _code(self, trans=None):
         "returns TikZ code"
-        return ('\\' + self.action_name
-                + _options_code(opt=self.opt, **self.kwoptions)
-                + ' ' + ' '.join(op._code(trans) for op in self.spec) + ';')
+        code = self._codes.get(trans)
+        if code is None:
+            code = ('\\' + self.action_name + self.opt + ' '
+                    + ' '.join(op._code(trans) for op in self.spec) + ';')
+            self._codes[trans] = code
+        return code
 
 
 # environments
@@ -774,6 +923,10 @@ class Scope:
     see
     [§12.3.1](https://pgf-tikz.github.io/pgf/pgfmanual.pdf#subsubsection.12.3.1)
     """
+    __slots__ = ('elements', 'opt')
+
+    # number of modifications of any environment, see `Picture._update_code`
+    _modifications = 0
 
     def __init__(self, opt=None, **kwoptions):
         self.elements = []
@@ -788,6 +941,7 @@ class Scope:
         objects.
         """
         self.elements.append(el)
+        Scope._modifications += 1
 
     def scope(self, opt=None, **kwoptions):
         """
@@ -799,12 +953,33 @@ class Scope:
         self._append(s)
         return s
 
+    def _emit(self, parts, trans=None):
+        """
+        append lines of TikZ code to the list `parts`
+
+        Nested environments append to the same list, so that the code of the
+        whole picture has to be joined only once.
+        """
+        parts.append(r'\begin{scope}' + self.opt)
+        self._emit_elements(parts, trans)
+        parts.append(r'\end{scope}')
+
+    def _emit_elements(self, parts, trans=None):
+        "append lines of TikZ code for the elements to the list `parts`"
+        for el in self.elements:
+            if isinstance(el, Scope):
+                el._emit(parts, trans)
+            else:
+                parts.append(el._code(trans))
+        # an empty environment contains an empty line
+        if not self.elements:
+            parts.append('')
+
     def _code(self, trans=None):
         "returns TikZ code"
-        code = r'\begin{scope}' + self.opt + '\n'
-        code += '\n'.join(el._code(trans) for el in self.elements) + '\n'
-        code += r'\end{scope}'
-        return code
+        parts = []
+        self._emit(parts, trans)
+        return '\n'.join(parts)
 
     # add actions on paths (§15)
 
@@ -978,9 +1153,7 @@ class Scope:
         [§12.4.1](https://pgf-tikz.github.io/pgf/pgfmanual.pdf#subsubsection.12.4.1)
         """
         # create options string without brackets
-        opt = _options_code(opt=opt, **kwoptions)
-        if opt.startswith('[') and opt.endswith(']'):
-            opt = opt[1:-1]
+        opt = _options_code(opt=opt, **kwoptions)[1:-1]
         # because braces are needed
         self._append(Raw(r'\tikzset{' + opt + '}'))
 
@@ -997,13 +1170,138 @@ class Scope:
         [§12.4.2](https://pgf-tikz.github.io/pgf/pgfmanual.pdf#subsubsection.12.4.2)
         """
         # create options string without brackets
-        opt = _options_code(opt=opt, **kwoptions)
-        if opt.startswith('[') and opt.endswith(']'):
-            opt = opt[1:-1]
+        opt = _options_code(opt=opt, **kwoptions)[1:-1]
         # because braces are needed
         self._append(Raw(r'\tikzset{' + name + '/.style={' + opt + '}}'))
 
 
+def _run_latex(args, cwd, jobname, message='LaTeX has failed'):
+    """
+    run LaTeX with arguments `args` in directory `cwd`
+
+    LaTeX runs in batch mode and stops at the first error, so that it neither
+    writes to the terminal nor tries to recover. Its output is discarded
+    instead of being captured and decoded, and the contents of the log file
+    `jobname.log`, which contains the same information, are returned instead.
+    If LaTeX fails, a `LatexError` is raised with `message` followed by the
+    contents of the log file.
+
+    helper function for `Picture._update`, `render_all`, and `_format_file`
+    """
+    completed = subprocess.run(
+        [cfg.latex, '-interaction=batchmode', '-halt-on-error'] + args,
+        cwd=cwd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL)
+    try:
+        with open(os.path.join(cwd, jobname + '.log'),
+                  errors='replace') as f:
+            log = f.read()
+    except OSError:
+        log = ''
+    if completed.returncode != 0:
+        raise LatexError(message + '\n' + log)
+    return log
+
+
+def _replace_in_cache(dst, create):
+    """
+    atomically create or replace file `dst` within `cfg.cache_dir`
+
+    `create` is called with the name of a temporary file next to `dst`, which
+    it has to create and which then replaces `dst`, so that concurrent readers
+    never see a partially written file. The temporary file is named uniquely
+    per process and thread, and is removed if anything fails. Since it is
+    created like any other file, it gets the same default permissions as the
+    files created by LaTeX.
+
+    helper function for `_move_to_cache` and `Picture._get_image_data`
+    """
+    temp = f'{dst}.{os.getpid()}-{threading.get_ident()}.tmp'
+    try:
+        create(temp)
+        os.replace(temp, dst)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+def _move_to_cache(src, dst):
+    """
+    move file `src` to `dst` within `cfg.cache_dir`, atomically replacing `dst`
+
+    If `src` is on another file system, it is copied using `_replace_in_cache`.
+
+    helper function for `Picture._update`, `render_all`, and `_format_file`
+    """
+    try:
+        os.replace(src, dst)
+    except OSError:
+        _replace_in_cache(dst, lambda temp: shutil.copyfile(src, temp))
+        os.remove(src)
+
+
+_temp_root = None
+"directory containing the temporary directories of all pictures"
+
+_temp_root_lock = threading.Lock()
+
+
+def _temp_dir():
+    """
+    create temporary directory
+
+    All temporary directories are created within a common directory, which is
+    created on first use and deleted at exit.
+
+    helper function for `Picture._update`
+    """
+    global _temp_root
+    with _temp_root_lock:
+        if _temp_root is None:
+            _temp_root = tempfile.mkdtemp(prefix='tikz-')
+            atexit.register(shutil.rmtree, _temp_root, ignore_errors=True)
+    return tempfile.mkdtemp(dir=_temp_root)
+
+
+_preloadable_preamble = [
+    r'\documentclass{article}',
+    r'\usepackage{tikz}',
+    r'\usetikzlibrary{external}']
+"part of the standard preamble that can be preloaded from a format file"
+
+
+def _format_file():
+    """
+    returns name of format file containing the preloadable preamble
+
+    The format file is created in `cfg.cache_dir` if it does not exist yet.
+    The name is absolute, because LaTeX runs in another directory.
+
+    helper function for `Picture._update`
+    """
+    sep = os.path.sep
+    engine = os.path.basename(cfg.latex)
+    name = os.path.abspath(cfg.cache_dir + sep + 'tikz-' + engine)
+    if os.path.isfile(name + '.fmt'):
+        return name
+    with tempfile.TemporaryDirectory(prefix='tikz-') as tempdir:
+        # create LaTeX file containing only the preamble
+        with open(tempdir + sep + 'tikz.tex', 'w') as f:
+            f.write('\n'.join(_preloadable_preamble)
+                    + '\n' + r'\csname endofdump\endcsname' + '\n')
+        # dump preamble into format file
+        _run_latex(
+            ['-ini', '-jobname=tikz', '&' + engine,
+             'mylatexformat.ltx', 'tikz.tex'],
+            tempdir, 'tikz', 'LaTeX has failed to create format file')
+        os.makedirs(cfg.cache_dir, exist_ok=True)
+        _move_to_cache(tempdir + sep + 'tikz.fmt', name + '.fmt')
+    return name
+
+
 class Picture(Scope):
     """
     tikzpicture environment
@@ -1013,12 +1311,21 @@ class Picture(Scope):
     the whole LaTeX document and its single `tikzpicture` environment.
 
     Set `tempdir` to use a specific directory for temporary files instead of an
-    automatically created one. Set `cache` to `False` if the picture should be
-    generated even though the TikZ code has not changed.
+    automatically created one. Compiled PDF files are kept in `cfg.cache_dir`.
+    Set `cache` to `False` if the picture should be generated even though the
+    TikZ code has not changed. After LaTeX has created the PDF file, the
+    contents of its log file, including the output of `\\typeout`, are
+    available as `latex_log`. It is `None` if the PDF file was taken from the
+    cache, and contains the log of the common run if the picture was compiled
+    by `render_all`.
 
     see
     [§12.2.1](https://pgf-tikz.github.io/pgf/pgfmanual.pdf#subsubsection.12.2.1)
     """
+    __slots__ = ('preamble', 'cache', 'tempdir', 'latex_log',
+                 '_doc', '_page', '_page_pdf', '_image_data', '_image_pdf',
+                 '_code_state', '_code', '_document_code', '_document_data',
+                 'temp_pdf')
 
     def __init__(self, tempdir=None, cache=True, opt=None, **kwoptions):
         super().__init__(opt=opt, **kwoptions)
@@ -1026,13 +1333,19 @@ class Picture(Scope):
         self.preamble = []
         # should the created PDF be cached?
         self.cache = cache
-        # create temporary directory for pdflatex etc.
-        if tempdir is None:
-            self.tempdir = tempfile.mkdtemp(prefix='tikz-')
-            # make sure it gets deleted
-            atexit.register(shutil.rmtree, self.tempdir, ignore_errors=True)
-        else:
-            self.tempdir = tempdir
+        # directory for pdflatex etc., created when needed if not specified
+        self.tempdir = tempdir
+        # log of the last LaTeX run for this picture
+        self.latex_log = None
+        # PyMuPDF document and page of the PDF file and image data converted
+        # from it, kept as long as the PDF file does not change
+        self._doc = None
+        self._page = None
+        self._page_pdf = None
+        self._image_data = {}
+        self._image_pdf = None
+        # state for which code is up to date, see `_update_code`
+        self._code_state = None
 
     def add_preamble(self, code):
         """
@@ -1047,6 +1360,7 @@ class Picture(Scope):
         """
         if code not in self.preamble:
             self.preamble.append(code)
+            Scope._modifications += 1
 
     def usetikzlibrary(self, name):
         """
@@ -1094,24 +1408,31 @@ class Picture(Scope):
     # code / pdf creation: private
     # private functions assume that code / pdf has already been created
 
-    def _update(self):
-        "ensure that up-to-date code & PDF file exists"
+    def _update_code(self):
+        "ensure that up-to-date code exists and determine PDF filename"
+
+        # Every modification of any environment increments a counter. If it
+        # and the configuration that affects the code have not changed since
+        # the last call, code and PDF filename are still up to date.
+        state = (Scope._modifications, cfg.preload, cfg.cache_dir, cfg.latex)
+        if state == self._code_state:
+            return
 
         sep = os.path.sep
 
         # create tikzpicture code
-        code = (r'\begin{tikzpicture}' + self.opt + '\n'
-                + '\n'.join(el._code() for el in self.elements) + '\n'
-                + r'\end{tikzpicture}')
-        self._code = code
+        parts = [r'\begin{tikzpicture}' + self.opt]
+        self._emit_elements(parts)
+        parts.append(r'\end{tikzpicture}')
+        self._code = '\n'.join(parts)
 
         # create document code
         # standard preamble
-        codelines = [
-            r'\documentclass{article}',
-            r'\usepackage{tikz}',
-            r'\usetikzlibrary{external}',
-            r'\tikzexternalize']
+        codelines = _preloadable_preamble.copy()
+        if cfg.preload:
+            # end of the part of the preamble contained in the format file
+            codelines.append(r'\csname endofdump\endcsname')
+        codelines.append(r'\tikzexternalize')
         # user-added preamble
         codelines += self.preamble
         # document body
@@ -1121,6 +1442,8 @@ class Picture(Scope):
             r'\end{document}']
         code = '\n'.join(codelines)
         self._document_code = code
+        # encoded once, for the digest and for writing the LaTeX file
+        self._document_data = code.encode()
 
         # We don't want a PDF file of the whole LaTeX document, but only of the
         # contents of the `tikzpicture` environment. This is achieved using
@@ -1130,52 +1453,126 @@ class Picture(Scope):
         # arguments directly. See section 53 of the PGF/TikZ manual.
 
         # does the PDF file have to be created?
-        #  This check is implemented by using the SHA1 digest of the LaTeX code
-        # in the PDF filename, and to skip creation if that file exists.
-        hash = hashlib.sha1(code.encode()).hexdigest()
-        self.temp_pdf = self.tempdir + sep + 'tikz-' + hash + '.pdf'
-        if self.cache and os.path.isfile(self.temp_pdf):
+        #  This check is implemented by using a digest of the LaTeX code
+        # in the PDF filename, and to skip creation if that file exists. The
+        # file is kept in the cache directory, so that it can be reused across
+        # sessions. Since the same code gives different results with
+        # different LaTeX engines, the engine is included in the digest.
+        # BLAKE2 is faster than SHA1 in software and part of the standard
+        # library; a 20-byte digest keeps filenames as long as before.
+        digest = hashlib.blake2b(self._document_data, digest_size=20)
+        digest.update(b'\0' + cfg.latex.encode())
+        hash = digest.hexdigest()
+        temp_pdf = cfg.cache_dir + sep + 'tikz-' + hash + '.pdf'
+        # The log of the last LaTeX run belongs to the previous PDF file.
+        if temp_pdf != getattr(self, 'temp_pdf', None):
+            self.latex_log = None
+        self.temp_pdf = temp_pdf
+
+        self._code_state = state
+
+    def _update(self, pdf=True):
+        """
+        ensure that up-to-date code & PDF file exists
+
+        If `pdf` is `False`, only the code and the PDF filename are updated.
+        """
+
+        sep = os.path.sep
+
+        self._update_code()
+        # If the PDF file is taken from the cache, `latex_log` is `None`,
+        # unless LaTeX has created this very file for this picture before.
+        if not pdf or (self.cache and os.path.isfile(self.temp_pdf)):
             return
 
+        # create temporary directory
+        if self.tempdir is None:
+            self.tempdir = _temp_dir()
+
         # create LaTeX file
         temp_tex = self.tempdir + sep + 'tikz.tex'
-        with open(temp_tex, 'w') as f:
-            f.write(code + '\n')
+        with open(temp_tex, 'wb') as f:
+            f.write(self._document_data)
+            f.write(b'\n')
 
         # process LaTeX file into PDF
-        completed = subprocess.run(
-            [cfg.latex,
-             '-jobname',
-             'tikz-figure0',
-             r'\def\tikzexternalrealjob{tikz}\input{tikz}'],
-            cwd=self.tempdir,
-            capture_output=True,
-            text=True)
-        self.latex_completed = completed
-        if completed.returncode != 0:
-            raise LatexError('LaTeX has failed\n' + completed.stdout)
-
-        # rename created PDF file
-        os.rename(self.tempdir + sep + 'tikz-figure0.pdf', self.temp_pdf)
+        args = []
+        if cfg.preload:
+            args.append('-fmt=' + _format_file())
+        args += [
+            '-jobname',
+            'tikz-figure0',
+            r'\def\tikzexternalrealjob{tikz}\input{tikz}']
+        self.latex_log = _run_latex(args, self.tempdir, 'tikz-figure0')
+
+        # release PyMuPDF document and image data, since the PDF file may be
+        # replaced
+        self._doc = None
+        self._page = None
+        self._page_pdf = None
+        self._image_pdf = None
+
+        # move created PDF file into cache
+        os.makedirs(cfg.cache_dir, exist_ok=True)
+        _move_to_cache(self.tempdir + sep + 'tikz-figure0.pdf',
+                       self.temp_pdf)
+
+    def _get_page(self):
+        "return PyMuPDF page of `Picture`"
+        import fitz
+        # open PDF file only if it has changed
+        if self._page_pdf != self.temp_pdf:
+            # The document is kept, too, because the page depends on it.
+            self._doc = fitz.open(self.temp_pdf)
+            self._page = self._doc.load_page(0)
+            self._page_pdf = self.temp_pdf
+        return self._page
+
+    def _get_image_data(self, suffix, convert):
+        """
+        return image data converted from the PDF file
+
+        The data are created by calling `convert` with the PyMuPDF page. They
+        are kept in memory and, if the picture is cached, in a file in
+        `cfg.cache_dir` which is named like the PDF file, but with `suffix`
+        instead of '.pdf'. A picture that is displayed again, also in a new
+        session, therefore does not have to be converted or even opened.
+        """
+        # forget data converted from another PDF file
+        if self._image_pdf != self.temp_pdf:
+            self._image_data = {}
+            self._image_pdf = self.temp_pdf
+        if suffix not in self._image_data:
+            filename = os.path.splitext(self.temp_pdf)[0] + suffix
+            if self.cache and os.path.isfile(filename):
+                with open(filename, 'rb') as f:
+                    data = f.read()
+            else:
+                data = convert(self._get_page())
+                if self.cache:
+                    def write(temp):
+                        with open(temp, 'wb') as f:
+                            f.write(data)
+                    _replace_in_cache(filename, write)
+            self._image_data[suffix] = data
+        return self._image_data[suffix]
 
     def _get_SVG(self):
         "return SVG data of `Picture`"
         # convert PDF to SVG using PyMuPDF
-        doc = fitz.open(self.temp_pdf)
-        page = doc.loadPage(0)
-        svg = page.getSVGimage()
-        return svg
+        data = self._get_image_data(
+            '.svg', lambda page: page.get_svg_image().encode())
+        return data.decode()
 
     def _get_PNG(self, dpi=None):
         "return PNG data of `Picture`"
         if dpi is None:
             dpi = cfg.display_dpi
-        # convert PDF to PNG using PyMuPDF
-        zoom = dpi / 72
-        doc = fitz.open(self.temp_pdf)
-        page = doc.loadPage(0)
-        pix = page.getPixmap(matrix=fitz.Matrix(zoom, zoom))
-        return pix.getPNGdata()
+        # render PDF as PNG using PyMuPDF
+        return self._get_image_data(
+            f'-{dpi}dpi.png',
+            lambda page: page.get_pixmap(dpi=dpi).tobytes('png'))
 
     # code / pdf creation: public
     # public functions make sure that code / pdf is created via `_update`
@@ -1215,11 +1612,9 @@ class Picture(Scope):
             shutil.copyfile(self.temp_pdf, filename)
         elif ext.lower() == '.png':
             # render PDF as PNG using PyMuPDF
-            zoom = dpi / 72
-            doc = fitz.open(self.temp_pdf)
-            page = doc.loadPage(0)
-            pix = page.getPixmap(matrix=fitz.Matrix(zoom, zoom), alpha=True)
-            pix.writePNG(filename)
+            page = self._get_page()
+            pix = page.get_pixmap(dpi=dpi, alpha=True)
+            pix.save(filename, output='png')
         elif ext.lower() == '.svg':
             # convert PDF to SVG using PyMuPDF
             svg = self._get_SVG()
@@ -1265,11 +1660,99 @@ class Picture(Scope):
             print('LatexError: LaTeX has failed')
             print(message)
         code_escaped = html.escape(self._code)
+        import IPython.display
         IPython.display.display(
             IPython.display.HTML(
                 cfg.demo_template.format(png_base64, code_escaped)))
 
 
+def render_all(pictures):
+    """
+    create PDF files of several pictures in a single LaTeX run
+
+    Normally, LaTeX is run separately for each picture when it is first
+    displayed or saved. For many pictures, it is more efficient to call this
+    function on them beforehand. Pictures are grouped by their preamble, and
+    each group is compiled as one LaTeX document, using the `preview` package
+    to create one tightly cropped page per `tikzpicture` environment. The
+    pages are then split into the PDF files in `cfg.cache_dir` that would have
+    been created for the individual pictures. Pictures whose PDF file already
+    exists are skipped, unless they were created with `cache=False`.
+    """
+    import fitz
+    sep = os.path.sep
+    # group pictures to be compiled by preamble
+    groups = {}
+    for pic in pictures:
+        pic._update(pdf=False)
+        if pic.cache and os.path.isfile(pic.temp_pdf):
+            continue
+        groups.setdefault(tuple(pic.preamble), []).append(pic)
+    os.makedirs(cfg.cache_dir, exist_ok=True)
+    for preamble, group in groups.items():
+        # create document code
+        codelines = [
+            r'\documentclass{article}',
+            r'\usepackage{tikz}',
+            r'\usepackage[active,tightpage]{preview}',
+            r'\PreviewEnvironment{tikzpicture}',
+            r'\setlength\PreviewBorder{0pt}']
+        codelines += preamble
+        codelines.append(r'\begin{document}')
+        codelines += [pic._code for pic in group]
+        codelines.append(r'\end{document}')
+        code = '\n'.join(codelines)
+        with tempfile.TemporaryDirectory(prefix='tikz-') as tempdir:
+            # create LaTeX file
+            with open(tempdir + sep + 'tikz.tex', 'wb') as f:
+                f.write((code + '\n').encode())
+            # process LaTeX file into PDF
+            log = _run_latex(['tikz'], tempdir, 'tikz')
+            # split PDF file into one file per picture
+            # Documents are closed explicitly, so that no file in the
+            # temporary directory is still open when it is removed.
+            with fitz.open(tempdir + sep + 'tikz.pdf') as doc:
+                if len(doc) != len(group):
+                    raise LatexError(f'LaTeX has created {len(doc)} pages '
+                                     f'for {len(group)} pictures')
+                for i, pic in enumerate(group):
+                    temp_pdf = tempdir + sep + f'tikz-figure{i}.pdf'
+                    with fitz.open() as single:
+                        single.insert_pdf(doc, from_page=i, to_page=i)
+                        single.save(temp_pdf)
+                    pic._doc = None
+                    pic._page = None
+                    pic._page_pdf = None
+                    pic._image_pdf = None
+                    pic.latex_log = log
+                    _move_to_cache(temp_pdf, pic.temp_pdf)
+
+
+def render_parallel(pictures, max_workers=None):
+    """
+    create PDF files of several pictures in parallel LaTeX runs
+
+    This is an alternative to `render_all` which compiles each picture
+    separately, like displaying or saving it would, but runs up to
+    `max_workers` LaTeX processes at the same time. If `max_workers` is not
+    specified, the number of processors is used. Pictures must not share a
+    `tempdir`.
+    """
+    import concurrent.futures
+    # unique pictures
+    pictures = list({id(pic): pic for pic in pictures}.values())
+    # create format file beforehand, so that it is not created concurrently
+    if cfg.preload:
+        _format_file()
+    if max_workers is None:
+        max_workers = os.cpu_count()
+    # LaTeX runs in a subprocess, so threads suffice for parallelism.
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        for future in [executor.submit(pic._update) for pic in pictures]:
+            # propagate exceptions
+            future.result()
+
+
 class LatexError(Exception):
     """
     error in the external LaTeX process
@@ -0,0 +1,11 @@
+"""
+package metadata
+
+Metadata that is not part of `pyproject.toml`, as plain literals. This module
+must not import anything, so that it can be read without importing `tikz`
+or its dependencies.
+"""
+
+# Copyright (C) 2020 Carsten Allefeld
+
+version = '0.1.0'
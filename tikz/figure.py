@@ -535,8 +535,7 @@ class Axes(Scope):
     # Axes options yaxis= 'left', 'right', None
     # privatize xaxis, yaxis?
 
-    def _code(self):
-        "returns TikZ code"
-        code = (self.decorations._code() + '\n'
-                + super()._code(self.trans))
-        return code
+    def _emit(self, parts, trans=None):
+        "append lines of TikZ code to the list `parts`"
+        self.decorations._emit(parts)
+        super()._emit(parts, self.trans)